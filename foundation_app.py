@@ -1,149 +1,374 @@
 # --- Imports ---
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
 from io import BytesIO
 import streamlit as st
 import json
 import datetime
 import math
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import pydeck as pdk
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, namedtuple
+from types import MappingProxyType
 import uuid
 
-st.cache_data.clear()
-st.cache_resource.clear()
+try:
+    import orjson
+except ImportError:  # optional speed-up; stdlib json is the fallback
+    orjson = None
 
 # --- Streamlit Config ---
 st.set_page_config(page_title="Pile Foundation Designer", layout="centered")
 st.title("🌍 Pile Foundation Designer")
 
 # --- Soil Types Dictionary ---
-soil_types = {
+soil_types = MappingProxyType({
     "Soft Clay": 25,
     "Medium Clay": 50,
     "Stiff Clay": 75,
     "Loose Sand": 0,
     "Dense Sand": 0
-}
+})
+SOIL_NAMES = tuple(soil_types)
+
+# Starting profile for the soil layer editor
+DEFAULT_LAYERS = pd.DataFrame({"type": ["Soft Clay"] * 2, "thickness": [5.0] * 2})
+
+# Session keys of the design form inputs and their starting values
+DESIGN_INPUT_DEFAULTS = {"design_diameter": 0.6, "design_safety_factor": 2.5, "design_total_load": 1000}
+
+# --- UI Translations ---
+@st.cache_resource
+def get_translations():
+    # Built once per server process instead of on every script rerun
+    return MappingProxyType({
+        "English": {
+            "title": "Pile Foundation Designer",
+            "calculate": "Calculate Pile Capacity",
+            "load": "Total Building Load (kN)",
+            "diameter": "Pile Diameter (m)",
+            "safety_factor": "Safety Factor",
+            "layers": "Soil Layers",
+            "cost": "Concrete Cost (USD/m³)",
+            "save": "Save This Design",
+        },
+        "မြန်မာ": {
+            "title": "အုတ်ထောင်ခြင်း ဒီဇိုင်းကိရိယာ",
+            "calculate": "အုတ်စွမ်းရည်တွက်ချက်ပါ",
+            "load": "အဆောက်အဦး တင်မြှောက်မှု (kN)",
+            "diameter": "အုတ်အချင်း (မီတာ)",
+            "safety_factor": "လုံခြုံမှုအချက်",
+            "layers": "မြေဆီလွှာများ",
+            "cost": "ကွန်ကရစ်ဈေးနှုန်း (USD/m³)",
+            "save": "ဒီဇိုင်း သိမ်းဆည်းပါ",
+        },
+        "ភាសាខ្មែរ": {
+            "title": "កម្មវិធីរចនាគោលស្ថាបនា",
+            "calculate": "គណនសមត្ថភាពគោលស្ថាបនា",
+            "load": "បន្ទុកសំណង់សរុប (kN)",
+            "diameter": "អង្កត់ផ្ចិតគោល (m)",
+            "safety_factor": "កត្តាសុវត្ថិភាព",
+            "layers": "ស្រទាប់ដី",
+            "cost": "តម្លៃកុងគ្រីត (USD/m³)",
+            "save": "រក្សាទុកការរចនានេះ",
+        }
+    })
 
 # --- Functions ---
+_PI = math.pi
+_PI4 = math.pi * 0.25
+
+PileGeom = namedtuple("PileGeom", ["perimeter", "base_area"])
+
+def pile_geom(diameter):
+    return PileGeom(_PI * diameter, _PI4 * diameter * diameter)
+
+@st.cache_data
 def suggest_layout(n_piles):
     rows = math.ceil(math.sqrt(n_piles))
     cols = math.ceil(n_piles / rows)
     return rows, cols
 
+@st.cache_data
+def pile_grid(rows, cols, spacing):
+    # Flat x/y pile centre coordinates, row by row
+    ys, xs = np.mgrid[0:rows, 0:cols].astype(np.float32) * spacing
+    return xs.ravel(), ys.ravel()
+
+@st.cache_data(max_entries=64)
 def draw_pile_layout(rows, cols, spacing):
-    fig, ax = plt.subplots(figsize=(5, 5))
-    for i in range(rows):
-        for j in range(cols):
-            x = j * spacing
-            y = i * spacing
-            ax.add_patch(plt.Circle((x, y), 0.3, color='gray'))
+    # Heavy plotting imports are deferred until a layout is actually drawn
+    from matplotlib.figure import Figure
+    from matplotlib.collections import EllipseCollection
+
+    # A bare Figure isn't registered with pyplot, so nothing holds on to it once it is rendered
+    fig = Figure(figsize=(5, 5))
+    ax = fig.subplots()
+    radius = 0.3
+    xs, ys = pile_grid(rows, cols, spacing)
+    # One collection sized in data units instead of a Circle patch per pile
+    piles = EllipseCollection(2 * radius, 2 * radius, 0, units="xy",
+                              offsets=np.column_stack([xs, ys]),
+                              offset_transform=ax.transData, color='gray')
+    ax.add_collection(piles)
+    # Collections don't autoscale the axes, so set the limits explicitly
+    pad = radius + 0.2
+    ax.set_xlim(-pad, (cols - 1) * spacing + pad)
+    ax.set_ylim(-pad, (rows - 1) * spacing + pad)
     ax.set_aspect('equal')
     ax.set_title(f"Pile Layout: {rows} x {cols}")
     ax.set_xlabel("X (m)")
     ax.set_ylabel("Y (m)")
     ax.grid(True)
-    plt.tight_layout()
-    return fig
+    fig.tight_layout()
+    # Cache the rendered PNG rather than the Figure, so sessions never share a mutable object
+    png = BytesIO()
+    fig.savefig(png, format="png", dpi=200, bbox_inches="tight")
+    return png.getvalue()
 
+@st.cache_data
 def calculate_concrete_volume(diameter, length):
-    return round(3.14 * (diameter / 2) ** 2 * length, 2)
+    return pile_geom(diameter).base_area * length
+
+def layer_key(layers):
+    # Hashable (cohesion, thickness) pairs so cached functions can key on the soil profile
+    return tuple((layer["cohesion"], layer["thickness"]) for layer in layers)
 
-def calculate_capacity(diameter, safety_factor, layers):
-    perimeter = 3.14 * diameter
-    length = sum(layer["thickness"] for layer in layers)
+@st.cache_data(max_entries=128)
+def calculate_capacity(diameter, safety_factor, layers_tuple):
+    cohesion, thickness = np.array(layers_tuple, dtype=float).T
+    perimeter, base_area = pile_geom(diameter)
+    length = thickness.sum()
 
-    skin = sum(layer["cohesion"] * perimeter * layer["thickness"] for layer in layers)
-    base_area = 3.14 * (diameter / 2) ** 2
-    end = layers[-1]["cohesion"] * 9 * base_area
+    skin = perimeter * np.dot(cohesion, thickness)
+    end = cohesion[-1] * 9 * base_area
     ultimate = skin + end
 
-    allowable = round(ultimate / safety_factor, 2)
+    # A non-positive SF is reported by capacity_problem rather than divided by
+    allowable = ultimate / safety_factor if safety_factor > 0 else 0.0
 
     # 🔁 Return extra details for learning mode
-    return allowable, round(length, 2), perimeter, base_area, skin, end, ultimate
-
+    return allowable, length, perimeter, base_area, skin, end, ultimate
+
+# Shown instead of dividing by zero when no layer provides cohesion (e.g. an all-sand profile)
+NO_CAPACITY_MESSAGE = "⚠️ These soil layers give zero pile capacity. Add a cohesive (clay) layer to size the piles."
+
+def capacity_problem(diameter, safety_factor, capacity):
+    # Reason the piles can't be sized, or None; checked before anything divides by the capacity
+    if diameter <= 0:
+        return "⚠️ Pile diameter must be greater than zero to size the piles."
+    if safety_factor <= 0:
+        return "⚠️ Safety factor must be greater than zero to size the piles."
+    if not np.isfinite(capacity) or capacity <= 0:
+        return NO_CAPACITY_MESSAGE
+    return None
+
+def settlement_problem(diameter, Es):
+    # Settlement is Q·L/(A·Es), so only the pile section and the soil modulus can make it undefined
+    if diameter <= 0:
+        return "⚠️ Pile diameter must be greater than zero to estimate settlement."
+    if Es <= 0:
+        return "⚠️ Soil modulus Es must be greater than zero to estimate settlement."
+    return None
+
+# Recent designs kept per session; older submissions fall back to calculate_capacity's own cache
+CAPACITY_CACHE_SIZE = 8
+
+def cached_capacity(diameter, safety_factor, layers_tuple):
+    # The Design, Layout and Settlement tabs all ask for the same result; keep it for the session
+    key = (diameter, safety_factor, layers_tuple)
+    cache = st.session_state.setdefault("_cap_cache", {})
+    if key not in cache:
+        if len(cache) >= CAPACITY_CACHE_SIZE:
+            # Dicts keep insertion order, so the first key is the oldest submission
+            del cache[next(iter(cache))]
+        cache[key] = calculate_capacity(*key)
+    return cache[key]
+
+@st.cache_data
 def calculate_group_efficiency(rows, cols, spacing, diameter):
     spacing_ratio = spacing / diameter
-    return round(min((rows * cols) / (1 + 0.1 * spacing_ratio), rows * cols), 2)
+    return min((rows * cols) / (1 + 0.1 * spacing_ratio), rows * cols)
+
+# Load steps (fraction of the design load) for the load vs. settlement curve
+LOAD_FRACTIONS = np.array([0.2, 0.4, 0.6, 0.8, 1.0])
 
+@st.cache_data
 def estimate_settlement(Q, L, diameter, Es):
-    A = 3.14 * (diameter / 2) ** 2
+    # Q may be a scalar load or a NumPy array of loads
+    A = pile_geom(diameter).base_area
     S = (Q * L) / (A * Es * 1000)
-    return round(S * 1000, 2)
+    return S * 1000
+
+@st.cache_data(max_entries=64)
+def settlement_curve_chart(Q, L, Es, diameter):
+    import altair as alt
+
+    loads = Q * LOAD_FRACTIONS
+    settlements = estimate_settlement(loads, L, diameter, Es)
+    curve = pd.DataFrame({"settlement": settlements, "load": loads})
+    # A plain Vega-Lite spec is cached, so no session ever shares a mutable Chart object
+    return alt.Chart(curve, title="Load vs. Settlement").mark_line(point=True).encode(
+        x=alt.X("settlement", title="Settlement (mm)"),
+        y=alt.Y("load", title="Load (kN)"),
+    ).to_dict()
+
+@st.cache_data(max_entries=32)
+def build_cost_bar_chart(names_tuple, costs_tuple):
+    import altair as alt
+
+    costs = pd.DataFrame({"project": names_tuple, "total_cost": costs_tuple})
+    return alt.Chart(costs, title="Total Cost per Saved Project").mark_bar(color="skyblue").encode(
+        x=alt.X("project", title=None, sort=None, axis=alt.Axis(labelAngle=-30)),
+        y=alt.Y("total_cost", title="USD"),
+    ).to_dict()
 
 def estimate_pile_cost(volume, cost_per_m3):
-    return round(volume * cost_per_m3, 2)
+    return volume * cost_per_m3
 
 def generate_excel_data(piles_needed, capacity, pile_length, diameter, volume_per_pile, total_volume, total_cost):
-    data = {
-        "Item": [
-            "Pile Diameter (m)",
-            "Pile Length (m)",
-            "Allowable Load per Pile (kN)",
-            "Required Number of Piles",
-            "Concrete Volume per Pile (m³)",
-            "Total Concrete Volume (m³)",
-            "Estimated Total Cost (USD)"
-        ],
-        "Value": [
-            diameter,
-            pile_length,
-            capacity,
-            piles_needed,
-            volume_per_pile,
-            total_volume,
-            total_cost
-        ]
-    }
-    return pd.DataFrame(data)
-
-def pile_design_summary(d, l, sf, c, load, cost_rate):
-    perimeter = 3.14 * d
-    skin = c * perimeter * l
-    base = c * 9 * (3.14 * (d / 2) ** 2)
-    allowable = (skin + base) / sf
-    piles = int((load / allowable) + 1)
-    volume = calculate_concrete_volume(d, l)
-    total_cost = estimate_pile_cost(volume * piles, cost_rate)
-    return round(allowable, 2), piles, round(volume, 2), round(total_cost, 2)
+    # (Item, Value) rows as a tuple so build_excel_bytes can be cached on them
+    return (
+        ("Pile Diameter (m)", diameter),
+        ("Pile Length (m)", pile_length),
+        ("Allowable Load per Pile (kN)", capacity),
+        ("Required Number of Piles", piles_needed),
+        ("Concrete Volume per Pile (m³)", volume_per_pile),
+        ("Total Concrete Volume (m³)", total_volume),
+        ("Estimated Total Cost (USD)", total_cost),
+    )
+
+@st.cache_data
+def build_excel_bytes(records):
+    import xlsxwriter
+
+    # Seven rows don't need a DataFrame; write them straight to the sheet
+    excel_buffer = BytesIO()
+    workbook = xlsxwriter.Workbook(excel_buffer, {"in_memory": True})
+    sheet = workbook.add_worksheet("Pile Summary")
+    sheet.set_column(0, 0, 32)
+    sheet.set_column(1, 1, 14)
+    decimal = workbook.add_format({"num_format": "#,##0.00"})
+    sheet.write_row(0, 0, ("Item", "Value"), workbook.add_format({"bold": True, "border": 1}))
+    for row, (item, value) in enumerate(records, start=1):
+        sheet.write_string(row, 0, item)
+        # Counts stay whole numbers; only measured quantities get two decimals
+        if isinstance(value, (int, np.integer)):
+            sheet.write_number(row, 1, value)
+        else:
+            sheet.write_number(row, 1, value, decimal)
+    workbook.close()
+    return excel_buffer.getvalue()
+
+@st.cache_data
+def pile_design_summary_vec(ds, ls, sfs, c, load, cost_rate):
+    # Each candidate design is one element of ds/ls/sfs; everything broadcasts in one pass
+    ds, ls, sfs = np.asarray(ds, dtype=float), np.asarray(ls, dtype=float), np.asarray(sfs, dtype=float)
+    area = _PI4 * ds * ds
+    skin = c * _PI * ds * ls
+    base = c * 9 * area
+    allowable = np.divide(skin + base, sfs, out=np.zeros_like(ds), where=sfs > 0)
+    # Rows that can't be sized are masked before the ceil so they never reach the int cast
+    valid = np.isfinite(allowable) & (allowable > 0)
+    piles = np.ceil(np.divide(load, allowable, out=np.zeros_like(ds), where=valid)).astype(np.int32)
+    volume = area * ls
+    total_cost = np.where(valid, volume * piles * cost_rate, np.nan)
+    return np.where(valid, allowable, np.nan), piles, volume, total_cost
 
 def generate_pdf(project_data, result_text):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
     c.setFont("Helvetica-Bold", 14)
     c.drawString(50, height - 50, "Pile Foundation Design Report")
-    c.setFont("Helvetica", 11)
-    y = height - 100
-    c.drawString(50, y, f"Project Name: {project_data.get('project_name', 'Unnamed')}")
-    y -= 30
-    c.drawString(50, y, "Soil Layers:")
+    # One text object for the body instead of a positioned drawString per line
+    text = c.beginText(50, height - 100)
+    text.setFont("Helvetica", 11)
+    text.setLeading(20)
+    text.textOut(f"Project Name: {project_data.get('project_name', 'Unnamed')}")
+    text.moveCursor(0, 30)
+    text.textOut("Soil Layers:")
+    text.moveCursor(20, 0)
     for i, layer in enumerate(project_data["soil_layers"], 1):
-        y -= 20
-        c.drawString(70, y, f"Layer {i}: {layer['type']}, {layer['thickness']} m, Cohesion: {layer['cohesion']} kPa")
-    y -= 40
-    for line in result_text.split("\n"):
-        c.drawString(50, y, line)
-        y -= 20
+        text.moveCursor(0, 20)
+        text.textOut(f"Layer {i}: {layer['type']}, {layer['thickness']} m, Cohesion: {layer['cohesion']} kPa")
+    text.moveCursor(-20, 40)
+    text.textLines(result_text)
+    c.drawText(text)
     c.save()
     buffer.seek(0)
     return buffer
 
+@st.cache_data
+def build_pdf_bytes(project_data, result_text):
+    return generate_pdf(project_data, result_text).getvalue()
+
+def dump_project_json(project_data):
+    # Bytes go straight to st.download_button without another str round-trip
+    if orjson is not None:
+        return orjson.dumps(project_data, option=orjson.OPT_INDENT_2)
+    return json.dumps(project_data, indent=2).encode()
+
+def round_for_display(value, digits=2):
+    # Saved designs keep full precision; only the copy shown on screen is rounded
+    if isinstance(value, dict):
+        return {key: round_for_display(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [round_for_display(item, digits) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), digits)
+    return value
+
+def load_project_json(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def project_file_problem(project):
+    # Uploaded projects must fit the Design form's limits as-is; nothing is clamped or truncated on load
+    if not isinstance(project, dict):
+        return "⚠️ This file is not a foundation project."
+    missing = [key for key in ("diameter", "safety_factor", "total_load", "soil_layers") if key not in project]
+    if missing:
+        return f"⚠️ The project file is missing: {', '.join(missing)}."
+    if not _is_number(project["diameter"]) or project["diameter"] < 0.1:
+        return f"⚠️ Pile diameter must be at least 0.1 m (file has {project['diameter']!r})."
+    if not _is_number(project["safety_factor"]) or project["safety_factor"] < 1.0:
+        return f"⚠️ Safety factor must be at least 1.0 (file has {project['safety_factor']!r})."
+    load = project["total_load"]
+    if not _is_number(load) or load < 1 or load != int(load):
+        return f"⚠️ Total building load must be a whole number of kN, at least 1 (file has {load!r})."
+    layers = project["soil_layers"]
+    if not isinstance(layers, list) or not layers:
+        return "⚠️ The project file has no soil layers."
+    for i, layer in enumerate(layers, 1):
+        if not isinstance(layer, dict) or layer.get("type") not in soil_types:
+            soil = layer.get("type") if isinstance(layer, dict) else layer
+            return f"⚠️ Soil layer {i} has an unknown soil type ({soil!r}). Use one of: {', '.join(SOIL_NAMES)}."
+        if not _is_number(layer.get("thickness")) or layer["thickness"] < 0.1:
+            return f"⚠️ Soil layer {i} thickness must be at least 0.1 m (file has {layer.get('thickness')!r})."
+    return None
+
+# Fixed BOQ columns; generate_boq adds the design quantities and rates
+_BOQ_TEMPLATE = pd.DataFrame({
+    "Item": ["Concrete", "Rebar (5%)", "Pile Excavation", "Pile Installation", "Mobilization & Setup"],
+    "Unit": ["m³", "kg", "m³", "each", "lump sum"],
+})
+
+@st.cache_data
 def generate_boq(piles, volume_per_pile, total_volume, concrete_rate, rebar_rate, labor_rate):
-    boq = [
-        {"Item": "Concrete", "Unit": "m³", "Qty": total_volume, "Unit Rate": concrete_rate},
-        {"Item": "Rebar (5%)", "Unit": "kg", "Qty": round(total_volume * 0.05 * 7850, 2), "Unit Rate": rebar_rate},
-        {"Item": "Pile Excavation", "Unit": "m³", "Qty": total_volume, "Unit Rate": 25.0},
-        {"Item": "Pile Installation", "Unit": "each", "Qty": piles, "Unit Rate": labor_rate},
-        {"Item": "Mobilization & Setup", "Unit": "lump sum", "Qty": 1, "Unit Rate": 1000.0},
-    ]
-    for row in boq:
-        row["Total"] = round(row["Qty"] * row["Unit Rate"], 2)
-    return pd.DataFrame(boq)
+    # Priced on full-precision quantities, the same basis as the Design tab and Dashboard costs
+    qty = np.array([total_volume, total_volume * 0.05 * 7850, total_volume, piles, 1.0])
+    rate = np.array([concrete_rate, rebar_rate, 25.0, labor_rate, 1000.0])
+    df = _BOQ_TEMPLATE.copy()
+    df["Qty"] = qty
+    df["Unit Rate"] = rate
+    df["Total"] = qty * rate
+    return df
 
 st.markdown(
     """
@@ -165,40 +390,7 @@ st.markdown(
 language = st.sidebar.selectbox("🌐 Language", ["English", "မြန်မာ", "ភាសាខ្មែរ"])
 learning_mode = st.sidebar.checkbox("🎓 Enable Learning Mode")
 
-translations = {
-    "English": {
-        "title": "Pile Foundation Designer",
-        "calculate": "Calculate Pile Capacity",
-        "load": "Total Building Load (kN)",
-        "diameter": "Pile Diameter (m)",
-        "safety_factor": "Safety Factor",
-        "layers": "Soil Layers",
-        "cost": "Concrete Cost (USD/m³)",
-        "save": "Save This Design",
-    },
-    "မြန်မာ": {
-        "title": "အုတ်ထောင်ခြင်း ဒီဇိုင်းကိရိယာ",
-        "calculate": "အုတ်စွမ်းရည်တွက်ချက်ပါ",
-        "load": "အဆောက်အဦး တင်မြှောက်မှု (kN)",
-        "diameter": "အုတ်အချင်း (မီတာ)",
-        "safety_factor": "လုံခြုံမှုအချက်",
-        "layers": "မြေဆီလွှာများ",
-        "cost": "ကွန်ကရစ်ဈေးနှုန်း (USD/m³)",
-        "save": "ဒီဇိုင်း သိမ်းဆည်းပါ",
-    },
-    "ភាសាខ្មែរ": {
-        "title": "កម្មវិធីរចនាគោលស្ថាបនា",
-        "calculate": "គណនសមត្ថភាពគោលស្ថាបនា",
-        "load": "បន្ទុកសំណង់សរុប (kN)",
-        "diameter": "អង្កត់ផ្ចិតគោល (m)",
-        "safety_factor": "កត្តាសុវត្ថិភាព",
-        "layers": "ស្រទាប់ដី",
-        "cost": "តម្លៃកុងគ្រីត (USD/m³)",
-        "save": "រក្សាទុកការរចនានេះ",
-    }
-}
-
-_ = translations[language]
+_ = get_translations()[language]
 
 st.title(_["title"])
 
@@ -216,61 +408,84 @@ tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
 
 with tab1:
     
-    # --- User Inputs ---
-    st.subheader("📌 Input Parameters")
-    diameter = st.number_input("Pile Diameter (m)", value=0.6, step=0.05)
-    safety_factor = st.number_input("Safety Factor", value=2.5)
-    total_load = st.number_input("Total Building Load (kN)", value=1000)
+    # A project loaded on the Export tab is written into the form's own widget state before they are
+    # created, so the form stays the only thing that builds st.session_state["design"]
+    loaded = st.session_state.pop("_loaded_project", None)
+    if loaded is not None:
+        st.session_state["design_diameter"] = float(loaded["diameter"])
+        st.session_state["design_safety_factor"] = float(loaded["safety_factor"])
+        st.session_state["design_total_load"] = int(loaded["total_load"])
+        st.session_state["layer_table"] = pd.DataFrame({
+            "type": [layer["type"] for layer in loaded["soil_layers"]],
+            "thickness": [float(layer["thickness"]) for layer in loaded["soil_layers"]],
+        })
+        # A fresh editor key drops any edits made on top of the previous table
+        st.session_state["layer_table_version"] = st.session_state.get("layer_table_version", 0) + 1
+    for key, value in DESIGN_INPUT_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
+
+    # Inputs are batched in a form so edits only rerun the calculations on "Update"
+    with st.form("design_form"):
+        # --- User Inputs ---
+        st.subheader("📌 Input Parameters")
+        diameter = st.number_input("Pile Diameter (m)", min_value=0.1, step=0.05, key="design_diameter")
+        safety_factor = st.number_input("Safety Factor", min_value=1.0, key="design_safety_factor")
+        total_load = st.number_input("Total Building Load (kN)", min_value=1, step=1, key="design_total_load")
 
-    st.markdown("---")
-    st.subheader("🧱 Soil Layers")
-    st.caption("📘 Cohesion values auto-fill based on soil type.")
+        st.markdown("---")
+        st.subheader("🧱 Soil Layers")
+        st.caption("📘 Cohesion values auto-fill based on soil type.")
 
-    if learning_mode:
-        st.markdown("📚 **Soil Cohesion** is the soil’s natural resistance to shear — typically in kPa.")
+        if learning_mode:
+            st.markdown("📚 **Soil Cohesion** is the soil’s natural resistance to shear — typically in kPa.")
+
+        # One grid widget for the whole profile instead of a selectbox + number_input per layer
+        edited_layers = st.data_editor(
+            st.session_state.get("layer_table", DEFAULT_LAYERS),
+            num_rows="dynamic",
+            hide_index=True,
+            key=f"soil_layers_{st.session_state.get('layer_table_version', 0)}",
+            column_config={
+                "type": st.column_config.SelectboxColumn("Soil Type", options=SOIL_NAMES, default="Soft Clay", required=True),
+                "thickness": st.column_config.NumberColumn("Thickness (m)", min_value=0.1, step=0.5, default=5.0, required=True),
+            },
+        ).dropna()
+
+        # --- Cost Input ---
+        st.markdown("---")
+        st.subheader("💰 Concrete Cost")
+        cost_rate = st.number_input("Cost per m³ of Concrete (USD)", value=120.0)
 
-    
-    layer_count = st.number_input("Number of Layers", min_value=1, max_value=5, value=2)
-    layers = []
-    for i in range(int(layer_count)):
-        col1, col2 = st.columns(2)
-        with col1:
-            soil = st.selectbox(f"Soil Type - Layer {i+1}", list(soil_types.keys()), key=f"type_{i}")
-        with col2:
-            thickness = st.number_input(f"Thickness (m) - Layer {i+1}", min_value=0.1, value=5.0, step=0.5, key=f"thick_{i}")
-        cohesion = soil_types[soil]
-        layers.append({"type": soil, "cohesion": cohesion, "thickness": thickness})
-    
-    # --- Cost Input ---
-    st.markdown("---")
-    st.subheader("💰 Concrete Cost")
-    cost_rate = st.number_input("Cost per m³ of Concrete (USD)", value=120.0)
+        st.form_submit_button("Update")
+
+    if edited_layers.empty:
+        st.warning("⚠️ Add at least one soil layer — using the default profile for now.")
+        edited_layers = DEFAULT_LAYERS
+    layers = [
+        {"type": soil, "cohesion": soil_types[soil], "thickness": float(thickness)}
+        for soil, thickness in zip(edited_layers["type"], edited_layers["thickness"])
+    ]
+    layers_tuple = layer_key(layers)
+
+    # Tabs below run as fragments and read the design inputs from here
+    st.session_state["design"] = {
+        "diameter": diameter,
+        "safety_factor": safety_factor,
+        "total_load": total_load,
+        "layers": layers,
+        "layers_tuple": layers_tuple,
+    }
     
     # --- Buttons ---
-    if st.button("Calculate Pile Capacity"):
-        capacity, total_depth, perimeter, base_area, skin, end, ultimate = calculate_capacity(diameter, safety_factor, layers)
-        piles_needed = int((total_load / capacity) + 1)
+    capacity, total_depth, perimeter, base_area, skin, end, ultimate = cached_capacity(diameter, safety_factor, layers_tuple)
+    problem = capacity_problem(diameter, safety_factor, capacity)
+    if problem:
+        st.error(problem)
+    if st.button("Calculate Pile Capacity", disabled=problem is not None):
+        piles_needed = math.ceil(total_load / capacity)
         volume_per_pile = calculate_concrete_volume(diameter, total_depth)
         total_volume = volume_per_pile * piles_needed
         total_cost = estimate_pile_cost(total_volume, cost_rate)
-    
-        st.success(f"✅ Allowable Load per Pile: {capacity} kN")
-        st.info(f"📏 Total Pile Length: {total_depth} m")
-        st.warning(f"🔢 Required Number of Piles: {piles_needed}")
-        st.info(f"🧱 Concrete per Pile: {volume_per_pile} m³")
-        st.info(f"🧱 Total Concrete Volume: {total_volume} m³")
-        st.success(f"💵 Estimated Total Cost: ${total_cost}")
-    
-        df = generate_excel_data(piles_needed, capacity, total_depth, diameter, volume_per_pile, total_volume, total_cost)
-        excel_buffer = BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="Pile Summary")
-        st.download_button("📥 Download Excel Report", data=excel_buffer.getvalue(), file_name="pile_summary.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    
-        project_data = {"project_name": "My Project", "soil_layers": layers}
-        result_text = f"""Allowable Load per Pile: {capacity} kN\nTotal Pile Length: {total_depth} m\nRequired Number of Piles: {piles_needed}"""
-        pdf_file = generate_pdf(project_data, result_text)
-        st.download_button("📄 Download PDF Report", data=pdf_file, file_name="foundation_report.pdf", mime="application/pdf")
 
         st.session_state["piles"] = piles_needed
         st.session_state["vol_per_pile"] = volume_per_pile
@@ -290,17 +505,37 @@ with tab1:
             "total_load": total_load,
         }
 
+    # Results and reports render from the last calculation so they survive reruns
+    if "calculated" in st.session_state:
+        calc = st.session_state["calculated"]
+        st.success(f"✅ Allowable Load per Pile: {calc['capacity']:.2f} kN")
+        st.info(f"📏 Total Pile Length: {calc['pile_length']:.2f} m")
+        st.warning(f"🔢 Required Number of Piles: {calc['piles_needed']}")
+        st.info(f"🧱 Concrete per Pile: {calc['volume_per_pile']:.2f} m³")
+        st.info(f"🧱 Total Concrete Volume: {calc['total_volume']:.2f} m³")
+        st.success(f"💵 Estimated Total Cost: ${calc['total_cost']:,.2f}")
+
+        excel_bytes = build_excel_bytes(generate_excel_data(calc["piles_needed"], calc["capacity"], calc["pile_length"], calc["diameter"], calc["volume_per_pile"], calc["total_volume"], calc["total_cost"]))
+        st.download_button("📥 Download Excel Report", data=excel_bytes, file_name="pile_summary.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+        project_data = {"project_name": "My Project", "soil_layers": calc["layers"]}
+        result_text = f"""Allowable Load per Pile: {calc['capacity']:.2f} kN\nTotal Pile Length: {calc['pile_length']:.2f} m\nRequired Number of Piles: {calc['piles_needed']}"""
+        pdf_bytes = build_pdf_bytes(project_data, result_text)
+        st.download_button("📄 Download PDF Report", data=pdf_bytes, file_name="foundation_report.pdf", mime="application/pdf")
+
         if learning_mode:
+            # Breakdown terms come back from the session capacity cache for the calculated inputs
+            perimeter, base_area, skin, end, ultimate = cached_capacity(calc["diameter"], calc["safety_factor"], layer_key(calc["layers"]))[2:]
             st.caption("🧠 Formula: Allowable = (Skin Friction + End Bearing) / Safety Factor")
             st.caption("📘 Skin Friction = Σ (cohesion × perimeter × thickness)")
             st.caption("📘 End Bearing = cohesion × 9 × base area")
 
         if learning_mode:
             st.markdown("### 🧾 Calculation Breakdown")
-            st.write(f"Perimeter = 3.14 × {diameter} = {3.14 * diameter:.2f} m")
-            st.write(f"Base Area = π × (d/2)² = {3.14 * (diameter / 2) ** 2:.2f} m²")
+            st.write(f"Perimeter = π × {calc['diameter']} = {perimeter:.2f} m")
+            st.write(f"Base Area = π × (d/2)² = {base_area:.2f} m²")
             st.write(f"Ultimate Load = Skin Friction + End Bearing = {ultimate:.2f} kN")
-            st.write(f"Allowable Load = Ultimate / SF = {ultimate:.2f} / {safety_factor} = {capacity:.2f} kN")
+            st.write(f"Allowable Load = Ultimate / SF = {ultimate:.2f} / {calc['safety_factor']} = {calc['capacity']:.2f} kN")
 
 
     if "calculated" in st.session_state:
@@ -314,35 +549,58 @@ with tab1:
             st.success(f"✅ '{project_name}' saved!")
             st.caption("💡 Your knowledge grows as your design evolves.")
 
-with tab2:
+@st.fragment
+def render_layout_tab():
+    design = st.session_state["design"]
+    diameter = design["diameter"]
+    safety_factor = design["safety_factor"]
+    total_load = design["total_load"]
+    layers_tuple = design["layers_tuple"]
 
     st.caption("Tip: Use standard pile spacing of 2.5–3.0m for typical foundations.")
-    if st.button("Show Pile Layout + Group Efficiency"):
-        capacity, total_depth, perimeter, base_area, skin, end, ultimate = calculate_capacity(diameter, safety_factor, layers)
-        piles_needed = int((total_load / capacity) + 1)
+    capacity, total_depth, perimeter, base_area, skin, end, ultimate = cached_capacity(diameter, safety_factor, layers_tuple)
+    problem = capacity_problem(diameter, safety_factor, capacity)
+    piles_needed = 0 if problem else math.ceil(total_load / capacity)
+    if problem is None and piles_needed <= 0:
+        # suggest_layout needs at least one pile to lay out
+        problem = "⚠️ The total building load must be greater than zero to lay out piles."
+    if problem:
+        st.error(problem)
+    if st.button("Show Pile Layout + Group Efficiency", disabled=problem is not None):
         rows, cols = suggest_layout(piles_needed)
     
         spacing = st.number_input("Pile Spacing (m)", value=2.5, step=0.1)
         st.write(f"🔢 Suggested Layout: {rows} rows × {cols} columns")
     
-        fig = draw_pile_layout(rows, cols, spacing)
-        st.pyplot(fig)
+        st.image(draw_pile_layout(rows, cols, spacing))
     
         efficiency = calculate_group_efficiency(rows, cols, spacing, diameter)
-        group_capacity = round(capacity * efficiency, 2)
+        group_capacity = capacity * efficiency
     
-        st.info(f"📉 Group Efficiency Factor: {efficiency}/{rows * cols}")
-        st.success(f"🧱 Total Group Capacity: {group_capacity} kN")
+        st.info(f"📉 Group Efficiency Factor: {efficiency:.2f}/{rows * cols}")
+        st.success(f"🧱 Total Group Capacity: {group_capacity:.2f} kN")
+
+with tab2:
+    render_layout_tab()
+
+@st.fragment
+def render_settlement_tab():
+    design = st.session_state["design"]
+    diameter = design["diameter"]
+    safety_factor = design["safety_factor"]
+    total_load = design["total_load"]
+    layers_tuple = design["layers_tuple"]
 
-with tab3:
-    
     st.subheader("📉 Settlement Estimation")
     
-    Es = st.number_input("Soil Modulus Es (kPa)", value=15000)
+    Es = st.number_input("Soil Modulus Es (kPa)", value=15000, min_value=1)
     
-    if st.button("Estimate Settlement"):
+    L = cached_capacity(diameter, safety_factor, layers_tuple)[1]
+    problem = settlement_problem(diameter, Es)
+    if problem:
+        st.error(problem)
+    if st.button("Estimate Settlement", disabled=problem is not None):
         Q = total_load
-        L = sum(layer["thickness"] for layer in layers)
     
         st.session_state["Q"] = Q
         st.session_state["L"] = L
@@ -350,7 +608,7 @@ with tab3:
         st.session_state["diameter"] = diameter
     
         settlement = estimate_settlement(Q, L, diameter, Es)
-        st.success(f"📏 Estimated Settlement: {settlement} mm")
+        st.success(f"📏 Estimated Settlement: {settlement:.2f} mm")
     
     if st.checkbox("📈 Show Load vs. Settlement Curve"):
         if "Q" in st.session_state and "L" in st.session_state:
@@ -359,57 +617,56 @@ with tab3:
             Es = st.session_state["Es"]
             diameter = st.session_state["diameter"]
     
-            loads = [Q * x for x in [0.2, 0.4, 0.6, 0.8, 1.0]]
-            settlements = [estimate_settlement(q, L, diameter, Es) for q in loads]
-    
-            import matplotlib.pyplot as plt
-            fig, ax = plt.subplots()
-            ax.plot(settlements, loads, marker='o')
-            ax.set_xlabel("Settlement (mm)")
-            ax.set_ylabel("Load (kN)")
-            ax.set_title("Load vs. Settlement")
-            ax.grid(True)
-            st.pyplot(fig)
+            st.vega_lite_chart(spec=settlement_curve_chart(Q, L, Es, diameter), width="stretch")
         else:
             st.warning("⚠️ Please click 'Estimate Settlement' first.")
 
-with tab4:
-    
+with tab3:
+    render_settlement_tab()
+
+@st.fragment
+def render_compare_tab():
+    design = st.session_state["design"]
+    total_load = design["total_load"]
+
     st.subheader("🆚 Design Comparison")
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("### Design A")
-        d1 = st.number_input("Diameter A (m)", value=0.6, key="d1")
-        l1 = st.number_input("Length A (m)", value=20.0, key="l1")
-        sf1 = st.number_input("Safety Factor A", value=2.5, key="sf1")
+        d1 = st.number_input("Diameter A (m)", value=0.6, min_value=0.1, key="d1")
+        l1 = st.number_input("Length A (m)", value=20.0, min_value=1.0, key="l1")
+        sf1 = st.number_input("Safety Factor A", value=2.5, min_value=1.0, key="sf1")
     
     with col2:
         st.markdown("### Design B")
-        d2 = st.number_input("Diameter B (m)", value=0.45, key="d2")
-        l2 = st.number_input("Length B (m)", value=25.0, key="l2")
-        sf2 = st.number_input("Safety Factor B", value=2.5, key="sf2")
+        d2 = st.number_input("Diameter B (m)", value=0.45, min_value=0.1, key="d2")
+        l2 = st.number_input("Length B (m)", value=25.0, min_value=1.0, key="l2")
+        sf2 = st.number_input("Safety Factor B", value=2.5, min_value=1.0, key="sf2")
     
     if st.button("Compare Designs"):
         load = total_load
         cohesion = 50  # For simplicity
     
         cost_rate = 120.0  # USD/m³
-        a = pile_design_summary(d1, l1, sf1, cohesion, load, cost_rate)
-        b = pile_design_summary(d2, l2, sf2, cohesion, load, cost_rate)
+        summary = pile_design_summary_vec((d1, d2), (l1, l2), (sf1, sf2), cohesion, load, cost_rate)
     
         st.write("### 📊 Comparison Table")
-        comp_df = pd.DataFrame({
-            "Metric": ["Allowable Capacity (kN)", "Pile Count", "Concrete per Pile (m³)", "Total Cost (USD)"],
-            "Design A": a,
-            "Design B": b
+        metrics = ["Allowable Capacity (kN)", "Pile Count", "Concrete per Pile (m³)", "Total Cost (USD)"]
+        formats = ["{:.2f}", "{}", "{:.2f}", "{:,.2f}"]
+        # Plain column lists; no per-row dicts for st.table to reshape
+        st.table({
+            "Metric": metrics,
+            "Design A": [fmt.format(values[0]) for fmt, values in zip(formats, summary)],
+            "Design B": [fmt.format(values[1]) for fmt, values in zip(formats, summary)],
         })
     
-        st.dataframe(comp_df)
-    
         st.success("✅ Design comparison complete. Choose wisely!")
 
+with tab4:
+    render_compare_tab()
+
 with tab5:
     st.subheader("📋 Bill of Quantities")
 
@@ -422,13 +679,19 @@ with tab5:
             rebar_rate=1.5,
             labor_rate=50.0
         )
-        st.dataframe(df_boq)
+        st.table(df_boq.round(2))
         st.success("✅ BOQ generated. Prices are editable in code.")
     else:
         st.info("💡 Calculate pile design first in the Design tab.")
 
-with tab6:
-    
+@st.fragment
+def render_export_tab():
+    design = st.session_state["design"]
+    diameter = design["diameter"]
+    safety_factor = design["safety_factor"]
+    total_load = design["total_load"]
+    layers = design["layers"]
+
     if st.button("📦 Download Project File"):
         project_data = {
             "diameter": diameter,
@@ -436,27 +699,38 @@ with tab6:
             "total_load": total_load,
             "soil_layers": layers
         }
-        json_string = json.dumps(project_data, indent=2)
+        json_bytes = dump_project_json(project_data)
     
         filename = f"foundation_project_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
     
-        st.download_button("⬇️ Download Project", data=json_string, file_name=filename, mime="application/json")
+        st.download_button("⬇️ Download Project", data=json_bytes, file_name=filename, mime="application/json")
 
     st.markdown("---")
     st.subheader("📁 Load Saved Project")
     uploaded_file = st.file_uploader("Upload your `.json` project file")
     
     if uploaded_file is not None:
-        loaded_data = json.load(uploaded_file)
-    
-        diameter = loaded_data["diameter"]
-        safety_factor = loaded_data["safety_factor"]
-        total_load = loaded_data["total_load"]
-        layers = loaded_data["soil_layers"]
-    
-        st.success("✅ Project loaded successfully!")
+        # Hand the project to the Design tab form once per upload, then rerun the whole app so every tab sees it
+        if uploaded_file.file_id == st.session_state.get("_loaded_file_id"):
+            st.success("✅ Project loaded successfully!")
+        else:
+            try:
+                loaded_data = load_project_json(uploaded_file.getvalue())
+            except ValueError:
+                loaded_data = None
+            problem = project_file_problem(loaded_data)
+            if problem:
+                st.error(problem)
+            else:
+                st.session_state["_loaded_file_id"] = uploaded_file.file_id
+                st.session_state["_loaded_project"] = loaded_data
+                st.rerun()
 
-with tab7:
+with tab6:
+    render_export_tab()
+
+@st.fragment
+def render_projects_tab():
     st.subheader("📁 Saved Projects")
 
     projects = st.session_state.get("saved_projects", {})
@@ -468,7 +742,10 @@ with tab7:
         if selected:
             details = projects[selected]
             st.write(f"### 🔍 Details for: {selected}")
-            st.json(details)
+            st.json(round_for_display(details))
+
+with tab7:
+    render_projects_tab()
 
 with tab8:
     st.subheader("📊 Project Summary Dashboard")
@@ -478,10 +755,10 @@ with tab8:
     # 🔹 Show metrics for the last calculated design
     if "calculated" in st.session_state:
         calc = st.session_state["calculated"]
-        st.metric("Allowable Load per Pile (kN)", calc["capacity"])
+        st.metric("Allowable Load per Pile (kN)", f"{calc['capacity']:.2f}")
         st.metric("Required Piles", calc["piles_needed"])
-        st.metric("Total Concrete Volume (m³)", calc["total_volume"])
-        st.metric("Estimated Cost (USD)", f"${calc['total_cost']}")
+        st.metric("Total Concrete Volume (m³)", f"{calc['total_volume']:.2f}")
+        st.metric("Estimated Cost (USD)", f"${calc['total_cost']:,.2f}")
     else:
         st.info("💡 Calculate a pile design in the Design tab to see dashboard results.")
 
@@ -490,52 +767,91 @@ with tab8:
     # 🔸 Visualize saved projects if they exist
     if "saved_projects" in st.session_state and st.session_state["saved_projects"]:
         st.markdown("### 📋 All Saved Designs")
-        df_projects = pd.DataFrame.from_dict(st.session_state["saved_projects"], orient="index")
-        st.dataframe(df_projects[["capacity", "piles_needed", "total_volume", "total_cost"]])
+        saved_projects = st.session_state["saved_projects"]
+        # Only the summary columns; the nested layer lists aren't shown here
+        cols = ("capacity", "piles_needed", "total_volume", "total_cost")
+        df_projects = pd.DataFrame({c: [p[c] for p in saved_projects.values()] for c in cols},
+                                   index=list(saved_projects.keys()))
+        st.dataframe(df_projects, column_config={c: st.column_config.NumberColumn(format="%.2f") for c in ("capacity", "total_volume", "total_cost")})
 
         st.markdown("### 📉 Total Cost Comparison")
-        fig, ax = plt.subplots()
-        ax.bar(df_projects.index, df_projects["total_cost"], color="skyblue")
-        ax.set_ylabel("USD")
-        ax.set_title("Total Cost per Saved Project")
-        ax.tick_params(axis='x', rotation=30)
-        st.pyplot(fig)
+        chart = build_cost_bar_chart(tuple(df_projects.index), tuple(df_projects["total_cost"]))
+        st.vega_lite_chart(spec=chart, width="stretch")
     else:
         st.info("💾 Save multiple designs to compare their total cost here.")
 
-with tab9:
-    # Initialize session storage
-    if "community_projects" not in st.session_state:
-        st.session_state["community_projects"] = []
-    if "user_name" not in st.session_state:
-        st.session_state["user_name"] = "Anonymous Engineer"
-    if "notifications" not in st.session_state:
-        st.session_state["notifications"] = []
-    if "comments" not in st.session_state:
-        st.session_state["comments"] = defaultdict(list)
-    if "reactions" not in st.session_state:
-        st.session_state["reactions"] = defaultdict(lambda: {"👍": 0, "💡": 0, "🧪": 0})
-    if "reaction_authors" not in st.session_state:
-        st.session_state["reaction_authors"] = defaultdict(lambda: {"👍": [], "💡": [], "🧪": []})
-    if "tags" not in st.session_state:
-        st.session_state["tags"] = defaultdict(list)
-    
+# --- Community Session State + Sidebar ---
+# Sidebar widgets can't be created inside a fragment, so they stay in the main script
+REACTION_ICONS = ("👍", "💡", "🧪")
+TAG_OPTIONS = ("Student Design", "Peer Reviewed", "Green Foundation")
+
+if "community_projects" not in st.session_state:
+    st.session_state["community_projects"] = []
+if "user_name" not in st.session_state:
+    st.session_state["user_name"] = "Anonymous Engineer"
+if "notifications" not in st.session_state:
+    st.session_state["notifications"] = []
+if "comments" not in st.session_state:
+    st.session_state["comments"] = defaultdict(list)
+if "reaction_authors" not in st.session_state:
+    # Who reacted with each icon; the reaction counts are the sizes of these sets
+    st.session_state["reaction_authors"] = defaultdict(lambda: {icon: set() for icon in REACTION_ICONS})
+if "reaction_totals" not in st.session_state:
+    # Running sum of all reactions per project, kept in step by add_reaction()
+    st.session_state["reaction_totals"] = defaultdict(int)
+if "tags" not in st.session_state:
+    st.session_state["tags"] = defaultdict(list)
+
+# --- User Profile ---
+st.sidebar.markdown("### 👤 Your Profile")
+st.session_state["user_name"] = st.sidebar.text_input("Name or Alias", st.session_state["user_name"])
+
+# --- Notifications ---
+st.sidebar.markdown("### 🔔 Notifications")
+user_notifications = [n for n in st.session_state["notifications"] if n["to"] == st.session_state["user_name"]]
+if user_notifications:
+    for note in user_notifications[::-1]:
+        st.sidebar.info(f"🔁 {note['from']} forked your design '{note['project']}'")
+else:
+    st.sidebar.caption("No new activity yet.")
+
+# --- Filter Map Region ---
+st.sidebar.markdown("### 🌐 Map Filters")
+country_filter = st.sidebar.text_input("Filter by Country/Region", key="geo_country_filter")
+tags_filter = st.sidebar.multiselect("Filter by Tags", TAG_OPTIONS, key="geo_tags_filter")
+
+@st.cache_data(max_entries=64)
+def filter_and_rank(projects, country, min_load, max_load, reaction_totals):
+    # Indices of the projects matching the filters, and of the top three by reactions
+    country = country.lower()
+    matches = [
+        i for i, p in enumerate(projects)
+        if country in p["country"].lower()
+        and min_load <= p["load"] <= max_load
+    ]
+    neg_totals = -np.asarray(reaction_totals, dtype=np.int64)[matches]
+    if neg_totals.size > 3:
+        # O(M) partition to the third-highest total; only those candidates (ties included) get sorted
+        candidates = np.flatnonzero(neg_totals <= np.partition(neg_totals, 2)[2])
+    else:
+        candidates = np.arange(neg_totals.size)
+    top = [matches[i] for i in candidates[np.argsort(neg_totals[candidates], kind="stable")][:3]]
+    return matches, top
+
+# Columns the map layer, its tooltip and the details table read
+MAP_COLUMNS = ["lat", "lon", "name", "user", "load", "country", "timestamp"]
+
+@st.cache_data(max_entries=64)
+def community_map_frame(projects):
+    # Drop placeholder (0) coordinates before building the frame, and keep only MAP_COLUMNS
+    rows = [tuple(p[c] for c in MAP_COLUMNS) for p in projects if p["lat"] != 0]
+    return pd.DataFrame(rows, columns=MAP_COLUMNS)
+
+@st.fragment
+def render_community_tab(country_filter, tags_filter):
     st.title("🌍 Luna GroundWorks – Community")
     st.markdown("### 🛠️ v1.1 — The Trust Layer")
     
-    # --- User Profile ---
-    st.sidebar.markdown("### 👤 Your Profile")
-    st.session_state["user_name"] = st.sidebar.text_input("Name or Alias", st.session_state["user_name"])
-    
-    # --- Notifications ---
-    st.sidebar.markdown("### 🔔 Notifications")
-    user_notifications = [n for n in st.session_state["notifications"] if n["to"] == st.session_state["user_name"]]
-    if user_notifications:
-        for note in user_notifications[::-1]:
-            st.sidebar.info(f"🔁 {note['from']} forked your design '{note['project']}'")
-    else:
-        st.sidebar.caption("No new activity yet.")
-    
     # --- Submit a Design ---
     st.subheader("📤 Submit a Design")
     with st.form("submit_form"):
@@ -580,6 +896,13 @@ with tab9:
         })
         st.success("✅ Forked & user notified")
     
+    # --- Reaction Function ---
+    def add_reaction(pid, icon):
+        users = st.session_state["reaction_authors"][pid][icon]
+        if st.session_state["user_name"] not in users:
+            users.add(st.session_state["user_name"])
+            st.session_state["reaction_totals"][pid] += 1
+    
     # --- Design Threads + Trust Layer ---
     st.markdown("---")
     st.subheader("🧵 Design Threads + 🔍 Filters + 🏷️ Tags + ❤️ Reactions")
@@ -592,35 +915,31 @@ with tab9:
     min_load = st.number_input("Minimum Load (kN)", min_value=0.0, value=0.0, step=10.0)
     max_load = st.number_input("Maximum Load (kN)", min_value=0.0, value=10000.0, step=10.0)
     
-    filtered_projects = [
-        p for p in projects
-        if filter_country.lower() in p["country"].lower()
-        and min_load <= p["load"] <= max_load
-    ]
+    reaction_totals = tuple(st.session_state["reaction_totals"].get(p["id"], 0) for p in projects)
+    matches, top = filter_and_rank(projects, filter_country, min_load, max_load, reaction_totals)
+    top_projects = [(projects[i], reaction_totals[i]) for i in top]
     
-    projects = filtered_projects  # Override with filtered list
+    projects = [projects[i] for i in matches]  # Override with filtered list
 
     st.caption(f"🔎 Showing {len(projects)} design(s) matching filters.")
 
+    # Index roots and their forks in one pass instead of rescanning projects per root
+    root_projects = []
+    children_by_parent = defaultdict(list)
+    for p in projects:
+        if p.get("parent_id"):
+            children_by_parent[p["parent_id"]].append(p)
+        else:
+            root_projects.append(p)
 
     
-    # Sort by most reactions
-    def total_reactions(pid):
-        r = st.session_state["reactions"][pid]
-        return r["👍"] + r["💡"] + r["🧪"]
-    
-    sorted_projects = sorted(projects, key=lambda p: total_reactions(p["id"]), reverse=True)
-    
     st.markdown("### 🔥 Trending Forks")
-    for p in sorted_projects[:3]:
-        st.markdown(f"**{p['name']}** by `{p['user']}` with {total_reactions(p['id'])} reactions")
-    
-    # ✅ Define this BEFORE using root_projects below
-    root_projects = [p for p in projects if not p.get("parent_id")]
+    for p, total in top_projects:
+        st.markdown(f"**{p['name']}** by `{p['user']}` with {total} reactions")
     
     st.markdown("### 📋 All Shared Designs (No Forks Yet)")
     for root in root_projects:
-        forks = [f for f in projects if f.get("parent_id") == root["id"]]
+        forks = children_by_parent[root["id"]]
         if not forks:
             with st.expander(f"{root['name']} by {root['user']}"):
                 st.markdown(f"**Diameter:** {root['diameter']} m  \n"
@@ -635,54 +954,37 @@ with tab9:
 
     
     # Threads
-    root_projects = [p for p in projects if not p.get("parent_id")]
     for root in root_projects:
-        forks = [f for f in projects if f.get("parent_id") == root["id"]]
+        forks = children_by_parent[root["id"]]
         if forks:
             st.markdown(f"### 🧩 {root['name']} by `{root['user']}`")
             for f in forks:
-                r = st.session_state["reactions"][f['id']]
-                badge = "✅ Community Verified" if r["👍"] >= 10 else ""
+                authors = st.session_state["reaction_authors"][f['id']]
+                badge = "✅ Community Verified" if len(authors["👍"]) >= 10 else ""
                 st.markdown(f"➡️ *{f['name']}* by `{f['user']}` on {f['timestamp']} {badge}")
                 with st.expander("🔍 Inspect Fork"):
-                    st.markdown(f"**Diameter:** {f['diameter']} m, **Length:** {f['length']} m, **Load:** {f['load']} kN")
-                    st.markdown(f"**Notes:** {f['notes']}")
+                    st.markdown(f"**Diameter:** {f['diameter']} m, **Length:** {f['length']} m, **Load:** {f['load']} kN  \n"
+                                f"**Notes:** {f['notes']}")
     
                     # Reactions
                     col1, col2, col3 = st.columns(3)
-                    if col1.button(f"👍 Helpful ({r['👍']})", key=f"like_{f['id']}"):
-                        r['👍'] += 1
-                        st.session_state["reaction_authors"][f['id']]['👍'].append(st.session_state['user_name'])
+                    if col1.button(f"👍 Helpful ({len(authors['👍'])})", key=f"like_{f['id']}"):
+                        add_reaction(f['id'], '👍')
                         st.rerun()
-                    if col2.button(f"💡 Innovative ({r['💡']})", key=f"idea_{f['id']}"):
-                        r['💡'] += 1
-                        st.session_state["reaction_authors"][f['id']]['💡'].append(st.session_state['user_name'])
+                    if col2.button(f"💡 Innovative ({len(authors['💡'])})", key=f"idea_{f['id']}"):
+                        add_reaction(f['id'], '💡')
                         st.rerun()
-                    if col3.button(f"🧪 Site-Tested ({r['🧪']})", key=f"test_{f['id']}"):
-                        r['🧪'] += 1
-                        st.session_state["reaction_authors"][f['id']]['🧪'].append(st.session_state['user_name'])
+                    if col3.button(f"🧪 Site-Tested ({len(authors['🧪'])})", key=f"test_{f['id']}"):
+                        add_reaction(f['id'], '🧪')
                         st.rerun()
     
                     # Tagging
-                    tag_options = ["Student Design", "Peer Reviewed", "Green Foundation"]
-                    selected_tags = st.multiselect("🏷️ Add Tags", tag_options, default=st.session_state["tags"][f['id']], key=f"tag_{f['id']}")
+                    selected_tags = st.multiselect("🏷️ Add Tags", TAG_OPTIONS, default=st.session_state["tags"][f['id']], key=f"tag_{f['id']}")
                     st.session_state["tags"][f['id']] = selected_tags  # ✅ Always sync full state
-                    
-                    if selected_tags:
-                        st.info("Tags: " + ", ".join(selected_tags))
-
-    
-                    # Reaction Details
-                    st.markdown("### 👥 Who Reacted")
-                    authors = st.session_state["reaction_authors"][f['id']]
-                    for icon in ["👍", "💡", "🧪"]:
-                        if authors[icon]:
-                            st.markdown(f"{icon} {', '.join(authors[icon])}")
     
                     # Comments
-                    st.markdown("### 💬 Comments")
                     comment_key = f['id']
-                    new_comment = st.text_input("Add comment", key=f"cmt_{comment_key}")
+                    new_comment = st.text_input("💬 Add comment", key=f"cmt_{comment_key}")
                     if st.button("Post", key=f"btn_{comment_key}") and new_comment:
                         st.session_state["comments"][comment_key].append({
                             "author": st.session_state["user_name"],
@@ -690,8 +992,17 @@ with tab9:
                             "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
                         })
                         st.success("Posted!")
-                    for c in st.session_state["comments"][comment_key]:
-                        st.markdown(f"- _{c['author']}_: {c['text']} ({c['time']})")
+    
+                    # Read-only details (tags, who reacted, comments) as one element, after the
+                    # widgets above so new tags and comments show up in the same run
+                    details = []
+                    if selected_tags:
+                        details.append("**Tags:** " + ", ".join(selected_tags))
+                    details.append("### 👥 Who Reacted")
+                    details += [f"{icon} {', '.join(sorted(authors[icon]))}" for icon in REACTION_ICONS if authors[icon]]
+                    details.append("### 💬 Comments")
+                    details += [f"- _{c['author']}_: {c['text']} ({c['time']})" for c in st.session_state["comments"][comment_key]]
+                    st.markdown("\n\n".join(details))
 
 
     st.title("🗺️ Global Community Map")
@@ -699,15 +1010,11 @@ with tab9:
     
     projects = st.session_state["community_projects"]
     
-    # --- Filter Map Region ---
-    st.sidebar.markdown("### 🌐 Map Filters")
-    country_filter = st.sidebar.text_input("Filter by Country/Region", key="geo_country_filter")
-    tags_filter = st.sidebar.multiselect("Filter by Tags", [...], key="geo_tags_filter")
-    
     # --- Filter logic ---
+    required_tags = set(tags_filter)
     filtered = []
     for p in projects:
-        tag_match = not tags_filter or any(tag in st.session_state["tags"][p["id"]] for tag in tags_filter)
+        tag_match = not required_tags or not required_tags.isdisjoint(st.session_state["tags"].get(p["id"], ()))
         country_match = country_filter.lower() in p["country"].lower()
         if tag_match and country_match:
             filtered.append(p)
@@ -715,9 +1022,9 @@ with tab9:
     st.caption(f"Showing {len(filtered)} project(s) on the map.")
     
     # --- Create Map Data ---
-    if filtered:
-        df_map = pd.DataFrame(filtered)
-        df_map = df_map[df_map["lat"] != 0]  # Remove placeholder coordinates
+    df_map = community_map_frame(filtered)
+    if not df_map.empty:
+        import pydeck as pdk
     
         st.pydeck_chart(pdk.Deck(
             initial_view_state=pdk.ViewState(
@@ -744,8 +1051,9 @@ with tab9:
     else:
         st.info("No geo-tagged designs to map. Try submitting one with coordinates!")
 
+with tab9:
+    render_community_tab(country_filter, tags_filter)
 
-    
 # To the engineers who design beneath the surface — this tool is for you.
 # Build boldly. Build sustainably. Build with clarity.
 # – KIM